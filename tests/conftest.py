@@ -0,0 +1,14 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_SCRIPT = Path(__file__).resolve().parent.parent / "亿通行交通费发票整理.py"
+
+
+@pytest.fixture(scope="session")
+def invoice_tool():
+    spec = importlib.util.spec_from_file_location("invoice_tool", _SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,32 @@
+def _trip(date, departure, amount):
+    return {'date': date, 'departure': departure, 'destination': '', 'amount': amount}
+
+
+def test_single_station_line(invoice_tool):
+    lines = ['1', '2025年1月2日', '08:00-09:00', '西直门站-东直门站', '2.00']
+    assert invoice_tool._parse_bus_lines(lines) == [_trip('2025年1月2日', '西直门站-东直门站', 2.0)]
+
+
+def test_station_spanning_two_lines(invoice_tool):
+    lines = ['1', '2025年1月2日', '08:00-09:00', '西直门站-', '东直门站', '3.00']
+    assert invoice_tool._parse_bus_lines(lines) == [_trip('2025年1月2日', '西直门站-东直门站', 3.0)]
+
+
+def test_amount_on_station_line(invoice_tool):
+    lines = ['1', '2025年1月2日', '08:00-09:00', '西直门站-东直门站 4.00', '合计 4.00 元']
+    assert invoice_tool._parse_bus_lines(lines) == [_trip('2025年1月2日', '西直门站-东直门站', 4.0)]
+
+
+def test_missing_amount_does_not_swallow_next_trip(invoice_tool):
+    lines = ['1', '2025年1月2日', '08:00-09:00', '西直门站',
+             '2', '2025年1月3日', '08:00-09:00', '东直门站', '3.00']
+    assert invoice_tool._parse_bus_lines(lines) == [_trip('2025年1月3日', '东直门站', 3.0)]
+
+
+def test_consecutive_trips(invoice_tool):
+    lines = ['序号', '日期', '1', '2025年1月2日', '08:00-09:00', '西直门站', '2.00',
+             '2', '2025年1月3日', '09:00-10:00', '东直门站', '3.00']
+    assert invoice_tool._parse_bus_lines(lines) == [
+        _trip('2025年1月2日', '西直门站', 2.0),
+        _trip('2025年1月3日', '东直门站', 3.0),
+    ]
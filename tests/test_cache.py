@@ -0,0 +1,66 @@
+import concurrent.futures
+import os
+
+import pytest
+
+
+@pytest.fixture
+def run(invoice_tool, tmp_path, monkeypatch):
+    """在临时目录中运行 main，用假的 process_directory 记录实际被解析的子目录"""
+    for name in ("1", "2"):
+        (tmp_path / "发票" / name).mkdir(parents=True)
+        (tmp_path / "发票" / name / "trip.pdf").write_bytes(b"trip")
+        (tmp_path / "发票" / name / "invoice.pdf").write_bytes(b"invoice")
+
+    parsed = []
+    failing = set()
+
+    def fake_process_directory(directory):
+        parsed.append(directory.name)
+        row = {'dir': directory.name, 'invoice_number': 'N', 'trip_total': 1.0,
+               'invoice_total': 1.0, 'status': '匹配'}
+        return row, [{'date': '2025年1月1日', 'departure': 'A', 'destination': '', 'amount': 1.0}], directory.name in failing
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("sys.argv", ["prog", "发票"])
+    monkeypatch.setattr(invoice_tool, "process_directory", fake_process_directory)
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", concurrent.futures.ThreadPoolExecutor)
+
+    def _run():
+        parsed.clear()
+        invoice_tool.main()
+        return sorted(parsed)
+
+    _run.failing = failing
+    _run.base = tmp_path / "发票"
+    return _run
+
+
+def test_unchanged_directories_are_served_from_cache(run):
+    assert run() == ["1", "2"]
+    assert run() == []
+
+
+def test_changed_pdf_is_parsed_again(run):
+    run()
+    trip = run.base / "1" / "trip.pdf"
+    trip.write_bytes(b"trip v2")
+    os.utime(trip, ns=(0, 0))
+    assert run() == ["1"]
+    assert run() == []
+
+
+def test_failed_directory_is_not_cached(run):
+    run.failing.add("2")
+    assert run() == ["1", "2"]
+    assert run() == ["2"]
+    run.failing.clear()
+    assert run() == ["2"]
+    assert run() == []
+
+
+def test_parser_change_invalidates_cache(run, invoice_tool, monkeypatch):
+    run()
+    monkeypatch.setattr(invoice_tool, "get_parser_fingerprint", lambda: "other")
+    assert run() == ["1", "2"]
+    assert run() == []
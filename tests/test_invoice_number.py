@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.fixture
+def number(invoice_tool):
+    return lambda text: invoice_tool.get_invoice_number_from_pdf({'text': text, 'blocks': []})
+
+
+def test_labeled_number_wins_over_earlier_invoice_code(number):
+    assert number("发票代码：011002000111\n发票号码：12345678") == "12345678"
+
+
+def test_labeled_number_wins_over_earlier_machine_number(number):
+    assert number("机器编号：499099912345\n发票号码：25117000000123456789") == "25117000000123456789"
+
+
+def test_labeled_number_wins_over_earlier_tax_id(number):
+    assert number("12100000400000624D\n发票号码：12345678") == "12345678"
+
+
+def test_credit_code_only_gives_unknown(number):
+    assert number("统一社会信用代码 911100001234567890") == "未知发票号码"
@@ -1,258 +1,379 @@
 import os
 import re
+import io
+import json
+import functools
+import hashlib
+import operator
+import concurrent.futures
 from pathlib import Path
 import fitz  # PyMuPDF
 import datetime
 import sys
 
-def get_invoice_number_from_pdf(pdf_path):
-    """从发票PDF中提取发票号码"""
+# 查找发票号码的常见模式，合并为一个正则，对全文只扫描一遍
+# 通常发票号码会标注为"发票号码"或"NO."等
+_INVOICE_ANY = re.compile(
+    r'发票号码[：:]\s*(?P<a>[A-Z0-9]{8,20})'  # 发票号码: 后面跟着字母数字
+    r'|发票号[：:]\s*(?P<b>[A-Z0-9]{8,20})'   # 发票号: 后面跟着字母数字
+    r'|NO\.?\s*(?P<c>[A-Z0-9]{8,20})'        # NO. 后面跟着字母数字
+    r'|(?P<d>\d{18,20})'                     # 20位左右的数字串（可能是发票号码）
+    r'|(?P<e>\d{8,12})'                      # 8-12位数字串（传统发票号码）
+)
+# 各模式按组名顺序的优先级：有标注的号码优先于裸数字串
+_INVOICE_GROUPS = 'abcde'
+_AMOUNT_RE = re.compile(r'(\d+\.\d{2})')
+_AMOUNT_COMMA_RE = re.compile(r'([\d,]+\.\d{2})')
+# 行程单全文中的公交格式标识（行程站点、金额(元)）和摘要总额，一次扫描同时识别
+_TRIP_HEADER_RE = re.compile(r'(行程站点)|(金额\(元\))|合计\s*([\d,]+\.\d{2})\s*元')
+_DATE_RE = re.compile(r'(\d{4}年\d{1,2}月\d{1,2}日)')
+_TIME_RE = re.compile(r'\d{1,2}:\d{2}-\d{1,2}:\d{2}')
+_TRIP_LINE_RE = re.compile(r'^\d+\s+(\d{4}年\d{1,2}月\d{1,2}日)\s+[\d:-]+\s+(.+?)\s+([\d,]+\.\d{2})$')
+_MERGE_START_RE = re.compile(r'^\d+\s+\d{4}年')
+
+# 解析结果缓存文件，保存在发票目录下；缓存文件格式变化时递增版本号使旧缓存失效
+# 解析逻辑的变化由脚本内容的指纹识别，无需手动递增版本号
+CACHE_FILENAME = '.yitongxing_cache.json'
+CACHE_VERSION = 3
+
+@functools.lru_cache(maxsize=1)
+def _pypdf_reader():
+    """按需导入pypdf，只在备用方案中用到，且整个进程只导入一次"""
+    from pypdf import PdfReader
+    return PdfReader
+
+def load_pdf(pdf_path):
+    """
+    打开PDF并只遍历一次页面，提取全文和文本块，供各解析函数复用。
+    打开失败时返回 None。
+    """
     try:
         doc = fitz.open(pdf_path)
-        text = ""
+        text_parts = []
+        blocks = []
         for page in doc:
-            text += page.get_text()
+            text_parts.append(page.get_text())
+            blocks.extend(page.get_text("blocks"))
         doc.close()
-
-        # 查找发票号码的常见模式
-        # 通常发票号码会标注为"发票号码"或"NO."等
-        patterns = [
-            r'发票号码[：:]\s*([A-Z0-9]{8,20})',  # 发票号码: 后面跟着字母数字
-            r'发票号[：:]\s*([A-Z0-9]{8,20})',    # 发票号: 后面跟着字母数字
-            r'NO\.?\s*([A-Z0-9]{8,20})',         # NO. 后面跟着字母数字
-            r'(\d{18,20})',                      # 20位左右的数字串（可能是发票号码）
-            r'(\d{8,12})'                        # 8-12位数字串（传统发票号码）
-        ]
-
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
-            if matches:
-                # 排除可能是统一社会信用代码的91开头的18位数字
-                for match in matches:
-                    if len(match) == 18 and match.startswith('91'):
-                        continue  # 跳过统一社会信用代码
-                    return match
-                # 如果只有统一社会信用代码，则返回未知发票号码
-                return "未知发票号码"
-
     except Exception as e:
-        print(f"警告 (pymupdf): 提取发票号码时处理发票 {pdf_path} 出错: {e}")
+        print(f"警告 (pymupdf): 读取PDF {pdf_path} 时出错: {e}")
+        return None
+
+    return {
+        'text': ''.join(text_parts),
+        'blocks': blocks,
+    }
+
+def _parse_amount(s):
+    """将可能带千分位逗号的金额字符串转换为浮点数，不含逗号时不做替换"""
+    return float(s.replace(',', '')) if ',' in s else float(s)
+
+def _parse_trip_line(line):
+    """按单行行程记录的格式解析一行文本，匹配失败时返回 None"""
+    match = _TRIP_LINE_RE.match(line)
+    if not match:
+        return None
+    date_str, station_info, amount_str = match.groups()
+    return {'date': date_str, 'departure': station_info, 'destination': '', 'amount': _parse_amount(amount_str)}
+
+def iter_lines(blocks):
+    """逐行产出文本块中的非空文本行（已去除首尾空白）"""
+    for block in blocks:
+        for line in block[4].split('\n'):
+            line = line.strip()
+            if line:
+                yield line
+
+def get_invoice_number_from_pdf(pdf):
+    """从已加载的发票PDF中提取发票号码"""
+    if pdf is None:
+        return "未知发票号码"
+
+    # 一次扫描记下每个模式的第一个可接受号码，再按模式优先级选取
+    # None 表示该模式只匹配到了统一社会信用代码
+    candidates = {}
+    for m in _INVOICE_ANY.finditer(pdf['text']):
+        group = m.lastgroup
+        match = m.group(group)
+        # 排除可能是统一社会信用代码的91开头的18位数字
+        if len(match) == 18 and match.startswith('91'):
+            candidates.setdefault(group, None)
+        elif group == _INVOICE_GROUPS[0]:
+            # 优先级最高的"发票号码"标注一旦命中，后面的文本不可能改变结果，立即返回
+            return match
+        elif candidates.get(group) is None:
+            candidates[group] = match
+
+    for group in _INVOICE_GROUPS:
+        if group in candidates:
+            # 如果该模式只有统一社会信用代码，则返回未知发票号码
+            return candidates[group] or "未知发票号码"
 
     return "未知发票号码"
 
 
-def get_total_from_invoice_definitive(pdf_path):
-    """遍历PDF的文本块，找到包含汉字大写金额的块，然后从该块中提取数字金额"""
-    try:
-        doc = fitz.open(pdf_path)
-        for page in doc:
-            blocks = page.get_text("blocks")
-            for block in blocks:
-                block_text = block[4]
-                if '圆' in block_text or '整' in block_text:
-                    match = re.search(r'([\d,]+\.\d{2})', block_text)
-                    if match:
-                        doc.close()
-                        return float(match.group(1).replace(',', ''))
-        doc.close()
-    except Exception as e:
-        print(f"警告 (pymupdf): 处理发票 {pdf_path} 时出错: {e}")
+def get_total_from_invoice_definitive(pdf):
+    """遍历已加载PDF的文本块，找到包含汉字大写金额的块，然后从该块中提取数字金额"""
+    if pdf is None:
+        return 0.0
+
+    for block in pdf['blocks']:
+        block_text = block[4]
+        if '圆' in block_text or '整' in block_text:
+            match = _AMOUNT_COMMA_RE.search(block_text)
+            if match:
+                return _parse_amount(match.group(1))
     return 0.0
 
+def _parse_bus_lines(lines):
+    """
+    解析公交行程单格式：按 序号 -> 日期 -> 时间 -> 站点 -> 金额 的顺序逐行推进的状态机。
+    通常站点信息可能跨越一行或多行，最多累积两行站点。返回行程列表。
+    """
+    trips = []
+    state = 'SEQ'
+    cur = {}
+    for line in lines:
+        if state == 'DATE':
+            date_match = _DATE_RE.search(line)
+            if date_match:
+                cur['date'] = date_match.group(1)
+                state = 'TIME'
+                continue
+            state = 'SEQ'
+        elif state == 'TIME':
+            if _TIME_RE.search(line):
+                cur['stations'] = []
+                state = 'STATION'
+                continue
+            state = 'SEQ'
+        elif state == 'STATION':
+            # 不含小数点的行不可能是金额，无需进入正则匹配
+            amount_match = _AMOUNT_RE.search(line) if '.' in line else None
+            if amount_match:
+                if cur['stations']:
+                    station_info = ''.join(cur['stations'])
+                else:
+                    # 站点行本身包含金额，提取站点信息（去除金额部分）
+                    station_info = line[:amount_match.start()].rstrip()
+
+                trips.append({
+                    'date': cur['date'],
+                    'departure': station_info,
+                    'destination': '',
+                    'amount': float(amount_match.group(1))
+                })
+                state = 'SEQ'
+                continue
+            # 只有数字的行是下一条记录的序号，说明本条记录缺少金额，丢弃并从该序号重新开始
+            if len(cur['stations']) < 2 and not line.isdigit():
+                cur['stations'].append(line)
+                continue
+            state = 'SEQ'
+
+        # 当前行不符合预期时回到初始状态，并重新检查是否是序号行（只包含数字）
+        if line.isdigit():
+            cur = {}
+            state = 'DATE'
+    return trips
+
 def get_trip_data_definitive(pdf_path):
     """
     终极版行程解析函数，可以处理多种PDF文本布局。
     使用更精确的文本行解析方法处理公交行程单。
-    返回 (行程列表, 摘要总额)。
+    返回 (行程列表, 摘要总额, 是否出错)。
     """
     trips = []
     summary_total = 0.0
 
-    try:
-        doc = fitz.open(pdf_path)
-        full_text = ""
-        for page in doc:
-            full_text += page.get_text()
-
-        # 首先，从全文中获取摘要总额
-        summary_match = re.search(r'合计\s*([\d,]+\.\d{2})\s*元', full_text)
-        if summary_match:
-            summary_total = float(summary_match.group(1).replace(',', ''))
+    # 行程单与发票一样只打开一次，全文和文本块在同一遍页面遍历中取得
+    pdf = load_pdf(pdf_path)
+    if pdf is None:
+        return trips, summary_total, True
 
-        # 检查是否包含公交行程单的标识
-        has_bus_format = '行程站点' in full_text and '金额(元)' in full_text
+    try:
+        full_text = pdf['text']
+
+        # 首先，从全文中获取摘要总额，同时检查是否包含公交行程单的标识
+        saw_station = saw_amount_header = saw_summary = False
+        for m in _TRIP_HEADER_RE.finditer(full_text):
+            if m.group(1):
+                saw_station = True
+            elif m.group(2):
+                saw_amount_header = True
+            elif not saw_summary:
+                summary_total = _parse_amount(m.group(3))
+                saw_summary = True
+            if saw_station and saw_amount_header and saw_summary:
+                break
+        has_bus_format = saw_station and saw_amount_header
 
         if has_bus_format:
-            # 使用更精确的解析方法处理公交行程单
-            # 获取所有文本行以进行更精确的解析
-            full_text_lines = []
-            for page in doc:
-                blocks = page.get_text("dict")["blocks"]
-                for block in blocks:
-                    if "lines" in block:
-                        for line in block["lines"]:
-                            line_text = ""
-                            for span in line["spans"]:
-                                line_text += span["text"]
-                            if line_text.strip():
-                                full_text_lines.append(line_text.strip())
-
-            # 解析公交行程单格式
-            i = 0
-            while i < len(full_text_lines):
-                line = full_text_lines[i]
-
-                # 检查是否是序号行（只包含数字）
-                if re.match(r'^\d+\s*$', line):
-                    # 检查后续行是否包含日期
-                    if i + 1 < len(full_text_lines):
-                        date_line = full_text_lines[i + 1]
-                        date_match = re.search(r'(\d{4}年\d{1,2}月\d{1,2}日)', date_line)
-
-                        if date_match:
-                            date_str = date_match.group(1)
-
-                            # 检查后续行是否包含时间
-                            if i + 2 < len(full_text_lines):
-                                time_line = full_text_lines[i + 2]
-                                time_match = re.search(r'\d{1,2}:\d{2}-\d{1,2}:\d{2}', time_line)
-
-                                if time_match:
-                                    # 检查后续行是否包含站点和金额
-                                    # 通常站点信息可能跨越一行或多行
-                                    if i + 3 < len(full_text_lines):
-                                        station_line1 = full_text_lines[i + 3]
-
-                                        if i + 4 < len(full_text_lines):
-                                            potential_station2_or_amount = full_text_lines[i + 4]
-
-                                            # 检查第5行是否是金额
-                                            amount_match = re.search(r'(\d+\.\d{2})', potential_station2_or_amount)
-                                            if amount_match:
-                                                # 第4行是站点1，第5行是金额
-                                                station_info = station_line1
-                                                amount = float(amount_match.group(1))
-
-                                                trips.append({
-                                                    'date': date_str,
-                                                    'departure': station_info,
-                                                    'destination': '',
-                                                    'amount': amount
-                                                })
-                                                i += 5  # 跳过这5行
-                                                continue
-                                            elif i + 5 < len(full_text_lines):
-                                                # 检查第6行是否是金额（站点跨越两行的情况）
-                                                potential_amount_line = full_text_lines[i + 5]
-                                                amount_match = re.search(r'(\d+\.\d{2})', potential_amount_line)
-                                                if amount_match:
-                                                    # 第4行和第5行都是站点信息，第6行是金额
-                                                    station_info = station_line1 + potential_station2_or_amount
-                                                    amount = float(amount_match.group(1))
-
-                                                    trips.append({
-                                                        'date': date_str,
-                                                        'departure': station_info,
-                                                        'destination': '',
-                                                        'amount': amount
-                                                    })
-                                                    i += 6  # 跳过这6行
-                                                    continue
-
-                                # 如果时间匹配失败，但站点行包含金额，处理这种情况
-                                amount_match = re.search(r'(\d+\.\d{2})', station_line1)
-                                if amount_match:
-                                    amount = float(amount_match.group(1))
-                                    # 提取站点信息（去除金额部分）
-                                    station_info = re.sub(r'\s*\d+\.\d{2}\s*$', '', station_line1).strip()
-
-                                    trips.append({
-                                        'date': date_str,
-                                        'departure': station_info,
-                                        'destination': '',
-                                        'amount': amount
-                                    })
-                                    i += 4  # 跳过这4行
-                                    continue
-                i += 1
+            # 使用更精确的解析方法处理公交行程单，文本块按行拆分后逐行送入状态机
+            trips = _parse_bus_lines(iter_lines(pdf['blocks']))
         else:
             # 处理非公交行程单（地铁等）
-            for page in doc:
-                blocks = page.get_text("blocks")
-                for block in blocks:
-                    block_text = block[4].strip()
-
-                    # 尝试将一个块视为一个潜在的行程记录
-                    # 规则：如果一个块包含 "年" "月" "日" 和一个金额，就尝试解析
-                    if '年' in block_text and '月' in block_text and '日' in block_text and re.search(r'\d+\.\d{2}', block_text):
-                        lines = block_text.split('\n')
-                        # 如果块内少于3行，不太可能是完整的行程记录
-                        if len(lines) < 3:
-                            continue
-
-                        try:
-                            # 这是一个单行记录，用正则表达式匹配
-                            if len(lines) == 1:
-                                 trip_line_pattern = re.compile(r'^\d+\s+(\d{4}年\d{1,2}月\d{1,2}日)\s+[\d:-]+\s+(.+?)\s+([\d,]+\.\d{2})$')
-                                 match = trip_line_pattern.match(lines[0])
-                                 if match:
-                                     date_str, station_info, amount_str = match.groups()
-                                     amount = float(amount_str.replace(',', ''))
-                                     trips.append({'date': date_str, 'departure': station_info, 'destination': '', 'amount': amount})
-                            # 这是一个多行记录 (像19/trip.pdf)
-                            else:
-                                # 假设金额是最后一行
-                                amount_line = [line for line in lines if re.search(r'(\d+\.\d{2})', line)]
-                                if amount_line:
-                                    amount = float(re.search(r'(\d+\.\d{2})', amount_line[-1]).group(1))
-                                else:
-                                    continue
-
-                                date_str = ""
-                                # 找到包含年份的行作为日期
-                                for line in lines:
-                                    if '年' in line:
-                                        date_str = line
-                                        break
-                                # 将日期和金额之外的行合并为站点信息
-                                station_info = " ".join([line for line in lines if date_str not in line and not re.search(r'\d+\.\d{2}', line) and not line.isdigit() and not re.match(r'[\d:-]+$', line)])
-
-                                trips.append({'date': date_str, 'departure': station_info, 'destination': '', 'amount': amount})
-
-                        except (ValueError, IndexError):
-                            # 如果解析失败，就跳过这个块
-                            continue
-        doc.close()
+            for block in pdf['blocks']:
+                block_text = block[4].strip()
+
+                # 尝试将一个块视为一个潜在的行程记录
+                # 规则：如果一个块包含 "年" "月" "日" 和一个金额，就尝试解析
+                if '年' in block_text and '月' in block_text and '日' in block_text and '.' in block_text and _AMOUNT_RE.search(block_text):
+                    lines = block_text.split('\n')
+                    # 如果块内少于3行，不太可能是完整的行程记录
+                    if len(lines) < 3:
+                        continue
+
+                    try:
+                        # 这是一个单行记录，用正则表达式匹配
+                        if len(lines) == 1:
+                             trip = _parse_trip_line(lines[0])
+                             if trip:
+                                 trips.append(trip)
+                        # 这是一个多行记录 (像19/trip.pdf)
+                        else:
+                            # 假设金额是最后一行，从后往前找到第一个包含金额的行
+                            amount = None
+                            for line in reversed(lines):
+                                amount_match = _AMOUNT_RE.search(line) if '.' in line else None
+                                if amount_match:
+                                    amount = float(amount_match.group(1))
+                                    break
+                            if amount is None:
+                                continue
+
+                            date_str = ""
+                            # 找到包含年份的行作为日期
+                            for line in lines:
+                                if '年' in line:
+                                    date_str = line
+                                    break
+                            # 将日期和金额之外的行合并为站点信息
+                            station_info = " ".join([line for line in lines if date_str not in line and not ('.' in line and _AMOUNT_RE.search(line)) and not line.isdigit() and not (line and all(c.isdigit() or c in ':-' for c in line))])
+
+                            trips.append({'date': date_str, 'departure': station_info, 'destination': '', 'amount': amount})
+
+                    except (ValueError, IndexError):
+                        # 如果解析失败，就跳过这个块
+                        continue
         # 如果以上策略失败，使用pypdf作为备用方案进行最后尝试
         if not trips:
-            from pypdf import PdfReader
+            PdfReader = _pypdf_reader()
             reader = PdfReader(pdf_path)
-            pypdf_text = ""
-            for page in reader.pages:
-                pypdf_text += page.extract_text() + "\n"
+            pypdf_text = '\n'.join(page.extract_text() for page in reader.pages)
 
-            raw_lines = pypdf_text.split('\n')
-            merged_lines = []
-            for line in raw_lines:
+            # 以序号+日期开头的行开始一条新记录，其余行合并到当前记录；每条记录合并完整后立即解析
+            current = None
+            for line in pypdf_text.split('\n'):
                 line = line.strip()
                 if not line: continue
-                if re.match(r'^\d+\s+\d{4}年', line):
-                    merged_lines.append(line)
-                elif merged_lines:
-                    merged_lines[-1] += " " + line
-
-            trip_line_pattern = re.compile(r'^\d+\s+(\d{4}年\d{1,2}月\d{1,2}日)\s+[\d:-]+\s+(.+?)\s+([\d,]+\.\d{2})$')
-            for line in merged_lines:
-                match = trip_line_pattern.match(line.strip())
-                if match:
-                    date_str, station_info, amount_str = match.groups()
-                    amount = float(amount_str.replace(',', ''))
-                    trips.append({'date': date_str, 'departure': station_info, 'destination': '', 'amount': amount})
-
-        return trips, summary_total
+                if _MERGE_START_RE.match(line):
+                    if current is not None:
+                        trip = _parse_trip_line(current)
+                        if trip:
+                            trips.append(trip)
+                    current = line
+                elif current is not None:
+                    current += " " + line
+            if current is not None:
+                trip = _parse_trip_line(current)
+                if trip:
+                    trips.append(trip)
+
+        return trips, summary_total, False
     except Exception as e:
         print(f"警告: 处理行程单 {pdf_path} 时发生严重错误: {e}")
-        return [], 0.0
+        return [], 0.0, True
+
+
+def process_directory(directory):
+    """
+    处理单个发票子目录：解析行程单和发票并比对金额。
+    返回 (比对结果, 行程列表, 是否出错)，供 main 汇总；出错的结果不写入缓存。
+    """
+    trip_path = directory / "trip.pdf"
+    invoice_path = directory / "invoice.pdf"
+
+    status = ""
+    parsed_trips, trip_total_summary, failed = get_trip_data_definitive(trip_path)
+
+    if not parsed_trips and trip_total_summary > 0:
+        # 如果解析失败，但摘要金额存在，则将摘要金额作为一条记录
+        parsed_trips = [{
+            'date': '见摘要',
+            'departure': f"来自 {directory.name}/trip.pdf (解析失败)",
+            'destination': "",
+            'amount': trip_total_summary,
+        }]
+
+    if invoice_path.exists():
+        # 发票PDF只打开一次，金额和发票号码共用同一份提取结果
+        invoice_pdf = load_pdf(invoice_path)
+        if invoice_pdf is None:
+            failed = True
+        invoice_total = get_total_from_invoice_definitive(invoice_pdf)
+        # 提取发票号码（从发票PDF内容中）
+        invoice_number = get_invoice_number_from_pdf(invoice_pdf)
+    else:
+        invoice_total = 0.0
+        invoice_number = "未找到发票"
+
+    if abs(trip_total_summary - invoice_total) < 0.01:
+        status = "匹配"
+    else:
+        status = f"不匹配 (差额: {trip_total_summary - invoice_total:.2f})"
+
+    comparison_row = {
+        'dir': directory.name,
+        'invoice_number': invoice_number,
+        'trip_total': trip_total_summary,
+        'invoice_total': invoice_total,
+        'status': status
+    }
+    return comparison_row, parsed_trips, failed
+
+
+def get_cache_key(directory):
+    """以 (路径, 修改时间, 文件大小) 标识目录下的行程单和发票，文件不存在时对应项为 None"""
+    key = []
+    for name in ("trip.pdf", "invoice.pdf"):
+        path = directory / name
+        try:
+            st = path.stat()
+        except OSError:
+            key.append(None)
+        else:
+            key.append([str(path), st.st_mtime_ns, st.st_size])
+    return key
+
+
+def get_parser_fingerprint():
+    """以本脚本内容的哈希作为解析逻辑的指纹，脚本更新后旧缓存自动失效"""
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def load_cache(cache_path):
+    """读取解析结果缓存，文件不存在、损坏、版本不符或由其他版本的脚本生成时返回空缓存"""
+    try:
+        data = json.loads(cache_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+        return {}
+    if data.get('parser') != get_parser_fingerprint():
+        return {}
+    return data.get('dirs', {})
+
+
+def save_cache(cache_path, cache):
+    """先写入临时文件再替换，保证缓存文件不会只写一半"""
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    payload = {'version': CACHE_VERSION, 'parser': get_parser_fingerprint(), 'dirs': cache}
+    try:
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"警告: 写入缓存 {cache_path} 时出错: {e}")
 
 
 def main():
@@ -269,7 +390,10 @@ def main():
         print(f"错误: 目录 {base_path} 不存在")
         return
 
-    invoice_dirs = sorted([d for d in base_path.iterdir() if d.is_dir() and d.name.isdigit()], key=lambda x: int(x.name))
+    # scandir 的目录项自带文件类型，判断是否为目录时无需再逐个 stat
+    with os.scandir(base_path) as it:
+        entries = [e for e in it if e.is_dir(follow_symlinks=False) and e.name.isdigit()]
+    invoice_dirs = sorted((Path(e.path) for e in entries), key=lambda x: int(x.name))
 
     comparison_results = []
     all_trips = []
@@ -277,71 +401,69 @@ def main():
     print(f"处理{directory_name}中的发票和行程单...")
     print("=" * 80)
 
+    # PDF未变化的目录直接使用缓存的解析结果，其余目录重新解析
+    cache_path = base_path / CACHE_FILENAME
+    cache = load_cache(cache_path)
+    new_cache = {}
+    pending_dirs = []
+    failed_dirs = set()
     for directory in invoice_dirs:
-        trip_path = directory / "trip.pdf"
-        invoice_path = directory / "invoice.pdf"
-
-        status = ""
-        parsed_trips, trip_total_summary = get_trip_data_definitive(trip_path)
-
-        if parsed_trips:
-            all_trips.extend(parsed_trips)
-        elif trip_total_summary > 0:
-            # 如果解析失败，但摘要金额存在，则将摘要金额作为一条记录
-            all_trips.append({
-                'date': '见摘要',
-                'departure': f"来自 {directory.name}/trip.pdf (解析失败)",
-                'destination': "",
-                'amount': trip_total_summary,
-            })
-
-        invoice_total = get_total_from_invoice_definitive(invoice_path) if invoice_path.exists() else 0.0
-
-        # 提取发票号码（从发票PDF内容中）
-        invoice_number = get_invoice_number_from_pdf(invoice_path) if invoice_path.exists() else "未找到发票"
-
-        if abs(trip_total_summary - invoice_total) < 0.01:
-            status = "匹配"
+        key = get_cache_key(directory)
+        entry = cache.get(directory.name)
+        if entry and entry.get('key') == key:
+            new_cache[directory.name] = entry
         else:
-            status = f"不匹配 (差额: {trip_total_summary - invoice_total:.2f})"
-
-        comparison_results.append({
-            'dir': directory.name,
-            'invoice_number': invoice_number,
-            'trip_total': trip_total_summary,
-            'invoice_total': invoice_total,
-            'status': status
-        })
-        print(f"处理目录: {directory_name}/{directory.name} -> 行程单: {trip_total_summary:.2f}, 发票: {invoice_total:.2f}, 发票号码: {invoice_number}, 状态: {status}")
+            new_cache[directory.name] = {'key': key}
+            pending_dirs.append(directory)
+
+    if pending_dirs:
+        # 各子目录互不依赖，使用进程池并行解析，结果按目录顺序返回
+        with concurrent.futures.ProcessPoolExecutor() as ex:
+            for directory, (comparison_row, parsed_trips, failed) in zip(pending_dirs, ex.map(process_directory, pending_dirs, chunksize=4)):
+                new_cache[directory.name]['row'] = comparison_row
+                new_cache[directory.name]['trips'] = parsed_trips
+                if failed:
+                    failed_dirs.add(directory.name)
+        # 解析出错的目录不写入缓存，下次运行时重新解析
+        save_cache(cache_path, {name: entry for name, entry in new_cache.items() if name not in failed_dirs})
+
+    results = [(new_cache[d.name]['row'], new_cache[d.name]['trips']) for d in invoice_dirs]
+    for comparison_row, parsed_trips in results:
+        comparison_results.append(comparison_row)
+        all_trips.extend(parsed_trips)
+        print(f"处理目录: {directory_name}/{comparison_row['dir']} -> 行程单: {comparison_row['trip_total']:.2f}, 发票: {comparison_row['invoice_total']:.2f}, 发票号码: {comparison_row['invoice_number']}, 状态: {comparison_row['status']}")
 
     # 根据目录名称生成输出文件名
     output_filename = f'{directory_name}汇总.md'
-    with open(output_filename, 'w', encoding='utf-8-sig') as f:
-        f.write(f"# 2025年{directory_name}车票报销明细\n\n")
+    # 先在内存中拼好整份报告，再一次性写入文件
+    buf = io.StringIO()
+    buf.write(f"# 2025年{directory_name}车票报销明细\n\n")
+
+    buf.write("## 第一部分: 金额比对摘要\n\n")
+    buf.write("| 目录 | 发票号码 | 行程单总额 | 发票总额 | 状态 |\n")
+    buf.write("|------|--------|----------|--------|------|\n")
+    buf.writelines(f"| {res['dir']} | {res['invoice_number']} | {res['trip_total']:.2f} | {res['invoice_total']:.2f} | {res['status']} |\n" for res in comparison_results)
 
-        f.write("## 第一部分: 金额比对摘要\n\n")
-        f.write("| 目录 | 发票号码 | 行程单总额 | 发票总额 | 状态 |\n")
-        f.write("|------|--------|----------|--------|------|\n")
-        for res in comparison_results:
-            f.write(f"| {res['dir']} | {res['invoice_number']} | {res['trip_total']:.2f} | {res['invoice_total']:.2f} | {res['status']} |\n")
+    grand_total_trip = sum(res['trip_total'] for res in comparison_results)
+    grand_total_invoice = sum(res['invoice_total'] for res in comparison_results)
+    buf.write(f"| 总计 | | {grand_total_trip:.2f} | {grand_total_invoice:.2f} | |\n\n")
 
-        grand_total_trip = sum(res['trip_total'] for res in comparison_results)
-        grand_total_invoice = sum(res['invoice_total'] for res in comparison_results)
-        f.write(f"| 总计 | | {grand_total_trip:.2f} | {grand_total_invoice:.2f} | |\n\n")
+    buf.write("## 第二部分: 详细行程清单\n\n")
 
-        f.write("## 第二部分: 详细行程清单\n\n")
+    # 每条行程在生成时都带有 'date' 字段（解析失败时为 '见摘要'）
+    all_trips.sort(key=operator.itemgetter('date'))
 
-        all_trips.sort(key=lambda x: x.get('date', ''))
+    grand_total_detailed = sum(trip['amount'] for trip in all_trips)
+    buf.write(f"**总计行程: {len(all_trips)} 笔**  \n")
+    buf.write(f"**报销总金额 (根据行程单明细计算): {grand_total_detailed:.2f} 元**  \n\n")
 
-        grand_total_detailed = sum(trip['amount'] for trip in all_trips)
-        f.write(f"**总计行程: {len(all_trips)} 笔**  \n")
-        f.write(f"**报销总金额 (根据行程单明细计算): {grand_total_detailed:.2f} 元**  \n\n")
+    buf.write("| 序号 | 日期 | 出发地 | 目的地 | 金额(元) |\n")
+    buf.write("|------|------|--------|--------|----------|\n")
+    buf.writelines(f"| {i} | {trip.get('date', 'N/A')} | {trip.get('departure', 'N/A')} | {trip.get('destination', 'N/A')} | {trip.get('amount', 0.0):.2f} |\n" for i, trip in enumerate(all_trips, 1))
+    buf.write("\n")
 
-        f.write("| 序号 | 日期 | 出发地 | 目的地 | 金额(元) |\n")
-        f.write("|------|------|--------|--------|----------|\n")
-        for i, trip in enumerate(all_trips, 1):
-            f.write(f"| {i} | {trip.get('date', 'N/A')} | {trip.get('departure', 'N/A')} | {trip.get('destination', 'N/A')} | {trip.get('amount', 0.0):.2f} |\n")
-        f.write("\n")
+    # 整份报告只编码一次，手动加上 UTF-8 BOM（与 utf-8-sig 一致）
+    Path(output_filename).write_bytes(b'\xef\xbb\xbf' + buf.getvalue().encode('utf-8'))
 
     # 同时生成发票号码汇总文件
     invoice_numbers = [res['invoice_number'] for res in comparison_results if res['invoice_number'] != "未找到发票"]